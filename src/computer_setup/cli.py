@@ -3,53 +3,70 @@
 from __future__ import annotations
 
 import argparse
+import functools
 import getpass
 import sys
 from pathlib import Path
 
-from .config import AppConfig, load_config, slugify_user
-from .security import protect_string, unprotect_string
-from .sheets import SheetsClient
+from .config import AppConfig, load_config_cached, slugify_user
+from .security import wipe
 from .state import Secrets, SetupState, STATE_FILE, clear_state, load_state, save_state
-from . import windows
+
+
+@functools.lru_cache(maxsize=None)
+def _resolve_path(value: str) -> Path:
+    return Path(value).expanduser().resolve()
 
 
 def _resolve_config(path: Path | None) -> AppConfig:
     if path is None:
         raise ValueError("Configuration file path is required")
-    if not path.exists():
-        raise FileNotFoundError(f"Configuration file not found: {path}")
-    return load_config(path)
+    # load_config_cached stats the file anyway; reuse that as the existence check.
+    try:
+        return load_config_cached(path)
+    except FileNotFoundError:
+        raise FileNotFoundError(f"Configuration file not found: {path}") from None
 
 
 def _resolve_credentials_path(args_value: str | None, config: AppConfig) -> Path:
     if args_value:
-        return Path(args_value).expanduser().resolve()
+        return _resolve_path(args_value)
     if config.google_credentials:
-        return config.google_credentials.expanduser().resolve()
+        return _resolve_path(str(config.google_credentials))
     raise ValueError(
         "Google credentials path must be supplied via --google-credentials or the configuration file."
     )
 
 
-def _prompt_password(prompt: str, confirm: bool = True) -> str:
+def _prompt_password(prompt: str, confirm: bool = True) -> bytearray:
+    from .windows import read_console_password as _read_password
+
     while True:
-        pw1 = getpass.getpass(prompt)
+        pw1 = _read_password(prompt)
         if not pw1:
             print("Password cannot be empty.")
             continue
         if not confirm:
             return pw1
-        pw2 = getpass.getpass("Confirm password: ")
-        if pw1 == pw2:
+        pw2 = _read_password("Confirm password: ")
+        matched = pw1 == pw2
+        wipe(pw2)
+        if matched:
             return pw1
+        wipe(pw1)
         print("Passwords do not match. Try again.")
 
 
 def _initial_run(args: argparse.Namespace) -> None:
+    from . import windows
+    from .launcher import build_launcher
+    from .security import protect_bytes
+    from .sheets import SheetsClient
+
     windows.require_elevated()
 
-    config_path = Path(args.config).expanduser().resolve()
+    config_path = _resolve_path(args.config)
+    state_path = _resolve_path(args.state)
     config = _resolve_config(config_path)
     domain_config = config.get_domain(args.domain)
 
@@ -58,7 +75,7 @@ def _initial_run(args: argparse.Namespace) -> None:
 
     assigned_slug = slugify_user(args.assigned_user)
 
-    seq, hostname, sheet_range = sheets.reserve_name(
+    seq, hostname, sheet_range, sheet_row = sheets.reserve_name(
         domain=args.domain,
         assigned_user=assigned_slug,
         sheet_id=domain_config.sheet_id,
@@ -68,55 +85,70 @@ def _initial_run(args: argparse.Namespace) -> None:
     print(f"[+] Reserved hostname: {hostname} (sequence {seq:03d})")
 
     local_admin_password = _prompt_password(f"Enter password for local admin '{args.local_admin}': ")
-    domain_username = input("Enter domain join username (DOMAIN\\user): ").strip()
-    domain_password = _prompt_password("Enter domain join password: ", confirm=False)
-
-    print("[+] Renaming computer...")
-    windows.rename_computer(hostname)
-
-    print("[+] Creating local administrator account...")
-    windows.create_or_update_local_admin(args.local_admin, local_admin_password)
-
-    print("[+] Configuring auto-logon for initial migration...")
-    windows.configure_autologon(args.local_admin, local_admin_password)
-
-    python_exe = Path(sys.executable).resolve()
-    state_path = Path(args.state).expanduser().resolve()
-
-    secrets = Secrets(
-        local_admin_password=protect_string(local_admin_password),
-        domain_username=domain_username,
-        domain_password=protect_string(domain_password),
-    )
-    state = SetupState.create(
-        domain=args.domain,
-        assigned_user=assigned_slug,
-        computer_name=hostname,
-        initial_user=args.initial_user,
-        local_admin_user=args.local_admin,
-        sheet_id=domain_config.sheet_id,
-        worksheet=domain_config.worksheet,
-        sheet_range=sheet_range,
-        secrets=secrets,
-    )
-    save_state(state, state_path)
-    print(f"[+] State saved to {state_path}")
-
-    run_once_command = (
-        f'"{python_exe}" -m computer_setup.cli post-login '
-        f'--state "{state_path}" --config "{config_path}"'
-    )
-    print("[+] Registering RunOnce continuation...")
-    windows.register_run_once("ComputerSetupPostLogin", run_once_command)
+    domain_password = bytearray()
+    try:
+        domain_username = input("Enter domain join username (DOMAIN\\user): ").strip()
+        domain_password = _prompt_password("Enter domain join password: ", confirm=False)
+
+        # Encrypt the buffers straight away; only the local admin password is
+        # needed again in the clear, and both are wiped however this block exits.
+        secrets = Secrets(
+            local_admin_password=protect_bytes(local_admin_password),
+            domain_username=domain_username,
+            domain_password=protect_bytes(domain_password),
+        )
+        wipe(domain_password)
+
+        print("[+] Renaming computer...")
+        windows.rename_computer(hostname)
+
+        print("[+] Creating local administrator account...")
+        windows.create_or_update_local_admin(args.local_admin, local_admin_password)
+
+        python_exe = Path(sys.executable).resolve()
+
+        state = SetupState.create(
+            domain=args.domain,
+            assigned_user=assigned_slug,
+            computer_name=hostname,
+            initial_user=args.initial_user,
+            local_admin_user=args.local_admin,
+            sheet_id=domain_config.sheet_id,
+            worksheet=domain_config.worksheet,
+            sheet_range=sheet_range,
+            sheet_row=sheet_row,
+            secrets=secrets,
+        )
+        save_state(state, state_path)
+        print(f"[+] State saved to {state_path}")
+
+        launcher = build_launcher()
+        run_once_command = (
+            f'"{python_exe}" "{launcher}" post-login '
+            f'--state "{state_path}" --config "{config_path}"'
+        )
+        print("[+] Configuring auto-logon and registering RunOnce continuation...")
+        windows.apply_registry_plans(
+            windows.autologon_plan(args.local_admin, local_admin_password),
+            windows.run_once_plan("ComputerSetupPostLogin", run_once_command),
+        )
+    finally:
+        wipe(local_admin_password)
+        wipe(domain_password)
 
     print("[!] Logging off current user to continue setup...")
     windows.logoff_current_user()
 
 
 def _post_login(args: argparse.Namespace) -> None:
+    from . import windows
+    from .launcher import remove_launcher
+    from .security import unprotect_bytes
+    from .sheets import SheetsClient
+
     windows.require_elevated()
-    state_path = Path(args.state).expanduser().resolve()
-    config_path = Path(args.config).expanduser().resolve()
+    state_path = _resolve_path(args.state)
+    config_path = _resolve_path(args.config)
 
     state = load_state(state_path)
     config = _resolve_config(config_path)
@@ -125,35 +157,38 @@ def _post_login(args: argparse.Namespace) -> None:
     google_creds = _resolve_credentials_path(args.google_credentials, config)
     sheets = SheetsClient(google_creds)
 
-    domain_password = unprotect_string(state.secrets.domain_password)
-
     print("[+] Clearing auto-logon configuration...")
     windows.clear_autologon()
 
-    print(f"[+] Removing build user '{state.initial_user}'...")
     if state.initial_user.lower() != state.local_admin_user.lower():
+        print(f"[+] Removing build user '{state.initial_user}'...")
         windows.remove_local_user(state.initial_user)
 
     print(f"[+] Joining domain {state.domain}...")
-    windows.join_domain(
-        state.domain,
-        state.secrets.domain_username,
-        domain_password,
-        ou_path=domain_config.ou_path,
-        restart=False,
-    )
+    domain_password = unprotect_bytes(state.secrets.domain_password)
+    try:
+        windows.join_domain(
+            state.domain,
+            state.secrets.domain_username,
+            domain_password,
+            ou_path=domain_config.ou_path,
+            restart=False,
+        )
+    finally:
+        wipe(domain_password)
 
     print("[+] Updating Google Sheet status...")
     sheets.update_status(
         sheet_id=state.sheet_id,
         worksheet=state.worksheet,
-        row_range=state.sheet_range,
+        row_number=state.sheet_row,
         status="Joined",
         notes="Provisioned via computer-setup",
     )
 
     print("[+] Cleaning up stored state...")
     clear_state(state_path)
+    remove_launcher()
 
     if not args.no_restart:
         print("[!] Restarting computer in 10 seconds...")
@@ -162,14 +197,14 @@ def _post_login(args: argparse.Namespace) -> None:
         print("[!] Restart skipped (use --no-restart).")
 
 
-def build_parser() -> argparse.ArgumentParser:
-    parser = argparse.ArgumentParser(description="Automate Windows workstation provisioning.")
-    sub = parser.add_subparsers(dest="command", required=True)
-
+def _common_parser() -> argparse.ArgumentParser:
     common = argparse.ArgumentParser(add_help=False)
     common.add_argument("--config", default="config/config.json", help="Path to configuration JSON.")
     common.add_argument("--google-credentials", help="Path to Google service-account JSON (overrides config).")
+    return common
 
+
+def _build_initial_parser(sub, common: argparse.ArgumentParser) -> None:
     init_parser = sub.add_parser("initial-run", parents=[common], help="Run from the temporary build account.")
     init_parser.add_argument("--domain", required=True, help="Domain key from configuration.")
     init_parser.add_argument("--assigned-user", required=True, help="User slug to embed in hostname.")
@@ -178,16 +213,45 @@ def build_parser() -> argparse.ArgumentParser:
     init_parser.add_argument("--state", default=str(STATE_FILE), help="Override state file location.")
     init_parser.set_defaults(func=_initial_run)
 
+
+def _build_post_parser(sub, common: argparse.ArgumentParser) -> None:
     post_parser = sub.add_parser("post-login", parents=[common], help="Continuation after auto logon.")
     post_parser.add_argument("--state", default=str(STATE_FILE), help="State file location.")
     post_parser.add_argument("--no-restart", action="store_true", help="Skip automatic restart after domain join.")
     post_parser.set_defaults(func=_post_login)
 
+
+_SUBPARSER_BUILDERS = {
+    "initial-run": _build_initial_parser,
+    "post-login": _build_post_parser,
+}
+
+
+def build_parser(command: str | None = None) -> argparse.ArgumentParser:
+    """
+    Build the CLI parser. When *command* names a known sub-command only that
+    sub-parser is constructed; otherwise (``--help``, no arguments, typos) the
+    full parser is built so usage output lists every command.
+    """
+
+    parser = argparse.ArgumentParser(description="Automate Windows workstation provisioning.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    common = _common_parser()
+
+    if command in _SUBPARSER_BUILDERS:
+        builders = [_SUBPARSER_BUILDERS[command]]
+    else:
+        builders = list(_SUBPARSER_BUILDERS.values())
+    for builder in builders:
+        builder(sub, common)
+
     return parser
 
 
 def main(argv: list[str] | None = None) -> None:
-    parser = build_parser()
+    if argv is None:
+        argv = sys.argv[1:]
+    parser = build_parser(argv[0] if argv else None)
     args = parser.parse_args(argv)
     try:
         args.func(args)
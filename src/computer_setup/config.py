@@ -2,26 +2,68 @@
 
 from __future__ import annotations
 
+import functools
 import json
 import re
-from dataclasses import dataclass
+import string
+from dataclasses import dataclass, field
 from pathlib import Path
 from typing import Optional
 
 
-@dataclass
+_HOSTNAME_FIELDS = frozenset({"seq", "user"})
+
+_TemplatePart = tuple[str, Optional[str], str]
+
+
+def _compile_template(template: str) -> Optional[tuple[_TemplatePart, ...]]:
+    """
+    Split *template* into ``(literal, field, spec)`` parts, or return ``None``
+    when it uses anything beyond plain ``{seq}``/``{user}`` fields so callers
+    can fall back to :meth:`str.format`.
+    """
+
+    parts: list[_TemplatePart] = []
+    try:
+        parsed = list(string.Formatter().parse(template))
+    except ValueError:
+        return None
+    for literal, field_name, spec, conversion in parsed:
+        if field_name is None:
+            parts.append((literal, None, ""))
+        elif field_name in _HOSTNAME_FIELDS and not conversion and "{" not in spec:
+            parts.append((literal, field_name, spec))
+        else:
+            return None
+    return tuple(parts)
+
+
+@dataclass(frozen=True)
 class DomainConfig:
     name: str
     sheet_id: str
     worksheet: str
     hostname_template: str
     ou_path: Optional[str]
+    _compiled: Optional[tuple[_TemplatePart, ...]] = field(init=False, repr=False, compare=False)
 
-    def build_hostname(self, seq: int, username: str) -> str:
-        return self.hostname_template.format(seq=seq, user=username)
-
+    def __post_init__(self) -> None:
+        object.__setattr__(self, "_compiled", _compile_template(self.hostname_template))
 
-@dataclass
+    def build_hostname(self, seq: int, username: str) -> str:
+        if self._compiled is None:
+            return self.hostname_template.format(seq=seq, user=username)
+        out = []
+        for literal, field_name, spec in self._compiled:
+            out.append(literal)
+            if field_name == "seq":
+                out.append(format(seq, spec))
+            elif field_name == "user":
+                out.append(format(username, spec))
+        return "".join(out)
+
+
+@dataclass(frozen=True)
 class AppConfig:
     google_credentials: Optional[Path]
     domains: dict[str, DomainConfig]
@@ -57,11 +99,36 @@ def load_config(path: Path) -> AppConfig:
     return AppConfig(google_credentials=credentials_path, domains=domains)
 
 
+@functools.lru_cache(maxsize=8)
+def _load_config_cached(path_str: str, mtime_ns: int) -> AppConfig:
+    return load_config(Path(path_str))
+
+
+def load_config_cached(path: Path) -> AppConfig:
+    """
+    Like :func:`load_config`, but reuses the parsed result while the file's
+    modification time is unchanged. Every hit returns the same objects; the
+    dataclasses are frozen, but callers must not mutate ``domains``.
+    """
+
+    return _load_config_cached(str(path), path.stat().st_mtime_ns)
+
+
 _USER_SLUG_RE = re.compile(r"[^a-z0-9]+")
 
 
 def slugify_user(value: str) -> str:
-    slug = _USER_SLUG_RE.sub("-", value.strip().lower())
+    slug = value.strip().lower()
+    # Most usernames are already valid slugs; skip the regex for those.
+    if (
+        slug.isascii()
+        and slug.replace("-", "").isalnum()
+        and "--" not in slug
+        and not slug.startswith("-")
+        and not slug.endswith("-")
+    ):
+        return slug
+    slug = _USER_SLUG_RE.sub("-", slug)
     slug = slug.strip("-")
     return slug or "user"
 
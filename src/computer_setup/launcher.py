@@ -0,0 +1,55 @@
+"""Build the zipapp used to resume setup from RunOnce after logon."""
+
+from __future__ import annotations
+
+import os
+import py_compile
+import shutil
+import tempfile
+import zipapp
+from pathlib import Path
+
+from .state import STATE_DIR
+
+LAUNCHER_FILE = STATE_DIR / "post_login.pyz"
+
+_PACKAGE_DIR = Path(__file__).resolve().parent
+
+
+def build_launcher(target: Path = LAUNCHER_FILE) -> Path:
+    """
+    Package ``computer_setup`` into a ``.pyz`` archive at *target*.
+
+    Modules are shipped with precompiled bytecode next to the sources, since
+    ``zipimport`` cannot write a ``__pycache__`` and would otherwise compile
+    every module from source on each boot.
+    """
+
+    with tempfile.TemporaryDirectory() as tmp:
+        staging = Path(tmp)
+        package = staging / _PACKAGE_DIR.name
+        package.mkdir()
+        for source in _PACKAGE_DIR.glob("*.py"):
+            copied = package / source.name
+            shutil.copyfile(source, copied)
+            py_compile.compile(
+                str(copied),
+                cfile=str(copied.with_suffix(".pyc")),
+                doraise=True,
+                invalidation_mode=py_compile.PycInvalidationMode.UNCHECKED_HASH,
+            )
+        target.parent.mkdir(parents=True, exist_ok=True)
+        # Build under a fresh name and swap it in, so a pre-existing file at
+        # *target* (and its owner/ACL) is replaced rather than overwritten.
+        tmp_target = target.with_name(f"{target.name}.{os.getpid()}.tmp")
+        try:
+            zipapp.create_archive(staging, tmp_target, main=f"{_PACKAGE_DIR.name}.cli:main")
+            os.replace(tmp_target, target)
+        except BaseException:
+            tmp_target.unlink(missing_ok=True)
+            raise
+    return target
+
+
+def remove_launcher(path: Path = LAUNCHER_FILE) -> None:
+    path.unlink(missing_ok=True)
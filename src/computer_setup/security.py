@@ -5,10 +5,10 @@ Data Protection API (DPAPI).
 
 from __future__ import annotations
 
-import base64
 import ctypes
+import functools
 from ctypes import POINTER, Structure, byref, c_void_p
-from ctypes.wintypes import BOOL, DWORD, LPWSTR
+from ctypes.wintypes import DWORD, LPWSTR
 
 CRYPTPROTECT_LOCAL_MACHINE = 0x4
 
@@ -17,8 +17,16 @@ class DATA_BLOB(Structure):
     _fields_ = [("cbData", DWORD), ("pbData", POINTER(ctypes.c_ubyte))]
 
 
-_crypt32 = ctypes.WinDLL("crypt32", use_last_error=True)
-_kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+# The DLLs are loaded on first use so importing this module is cheap and
+# does not fail on non-Windows platforms.
+@functools.lru_cache(maxsize=None)
+def _get_crypt32() -> ctypes.WinDLL:
+    return ctypes.WinDLL("crypt32", use_last_error=True)
+
+
+@functools.lru_cache(maxsize=None)
+def _get_kernel32() -> ctypes.WinDLL:
+    return ctypes.WinDLL("kernel32", use_last_error=True)
 
 
 def _raise_last_error() -> None:
@@ -26,63 +34,95 @@ def _raise_last_error() -> None:
     raise OSError(code, ctypes.FormatError(code))
 
 
-def _to_blob(data: bytes) -> tuple[DATA_BLOB, ctypes.Array]:
-    buf = ctypes.create_string_buffer(data)
+def _to_blob(data: bytes | bytearray) -> tuple[DATA_BLOB, ctypes.Array]:
+    buf = (ctypes.c_ubyte * len(data)).from_buffer_copy(data)
     blob = DATA_BLOB(len(data), ctypes.cast(buf, POINTER(ctypes.c_ubyte)))
     return blob, buf
 
 
-def _from_blob(blob: DATA_BLOB) -> bytes:
-    buffer = ctypes.cast(blob.pbData, POINTER(ctypes.c_char))
+def wipe(buf: bytearray | ctypes.Array) -> None:
+    """Overwrite *buf* with zeros in place."""
+    if isinstance(buf, bytearray):
+        buf[:] = bytes(len(buf))
+    else:
+        ctypes.memset(buf, 0, ctypes.sizeof(buf))
+
+
+def _from_blob(blob: DATA_BLOB) -> bytearray:
+    # Copy into a mutable buffer the caller can wipe, and zero the
+    # DPAPI-allocated memory before handing it back to LocalFree.
+    out = bytearray(blob.cbData)
     try:
-        return ctypes.string_at(buffer, blob.cbData)
+        if blob.cbData:
+            ctypes.memmove((ctypes.c_char * blob.cbData).from_buffer(out), blob.pbData, blob.cbData)
+        return out
     finally:
-        _kernel32.LocalFree(blob.pbData)
+        ctypes.memset(blob.pbData, 0, blob.cbData)
+        _get_kernel32().LocalFree(blob.pbData)
 
 
-def protect_string(secret: str) -> str:
+def protect_bytes(secret: bytearray) -> bytes:
     """
-    Encrypt *secret* using the local machine DPAPI scope and return it as a
-    Base64 string suitable for storage.
+    Encrypt the UTF-16-LE encoded *secret* using the local machine DPAPI
+    scope and return the raw ciphertext. *secret* is left untouched; the
+    caller should :func:`wipe` it once it is no longer needed.
     """
 
-    if not isinstance(secret, str):
-        raise TypeError("secret must be a string")
+    if not isinstance(secret, (bytes, bytearray)):
+        raise TypeError("secret must be a bytearray")
 
-    data = secret.encode("utf-16-le")
-    in_blob, _buffer = _to_blob(data)
+    in_blob, buffer = _to_blob(secret)
     out_blob = DATA_BLOB()
 
-    result = _crypt32.CryptProtectData(
-        byref(in_blob),
-        LPWSTR("computer-setup"),
-        None,
-        None,
-        None,
-        CRYPTPROTECT_LOCAL_MACHINE,
-        byref(out_blob),
-    )
-    if result != BOOL(True):
+    try:
+        result = _get_crypt32().CryptProtectData(
+            byref(in_blob),
+            LPWSTR("computer-setup"),
+            None,
+            None,
+            None,
+            CRYPTPROTECT_LOCAL_MACHINE,
+            byref(out_blob),
+        )
+    finally:
+        wipe(buffer)
+    if not result:
         _raise_last_error()
 
-    protected = _from_blob(out_blob)
-    return base64.b64encode(protected).decode("ascii")
+    return bytes(_from_blob(out_blob))
 
 
-def unprotect_string(protected: str) -> str:
+def protect_string(secret: str) -> bytes:
     """
-    Decrypt a Base64 encoded string produced by :func:`protect_string`.
+    Encrypt *secret* using the local machine DPAPI scope and return the raw
+    ciphertext. Encoding for storage is left to the caller.
     """
 
-    if not isinstance(protected, str):
-        raise TypeError("protected must be a string")
+    if not isinstance(secret, str):
+        raise TypeError("secret must be a string")
+
+    data = bytearray(secret.encode("utf-16-le"))
+    try:
+        return protect_bytes(data)
+    finally:
+        wipe(data)
+
+
+def unprotect_bytes(protected: bytes) -> bytearray:
+    """
+    Decrypt ciphertext produced by :func:`protect_bytes` or
+    :func:`protect_string` into a UTF-16-LE ``bytearray`` the caller should
+    :func:`wipe` after use.
+    """
+
+    if not isinstance(protected, (bytes, bytearray)):
+        raise TypeError("protected must be bytes")
 
-    raw = base64.b64decode(protected.encode("ascii"))
-    in_blob, _buffer = _to_blob(raw)
+    in_blob, _buffer = _to_blob(protected)
     out_blob = DATA_BLOB()
     description = LPWSTR()
 
-    result = _crypt32.CryptUnprotectData(
+    result = _get_crypt32().CryptUnprotectData(
         byref(in_blob),
         byref(description),
         None,
@@ -91,14 +131,23 @@ def unprotect_string(protected: str) -> str:
         0,
         byref(out_blob),
     )
-    if result != BOOL(True):
+    if not result:
         _raise_last_error()
 
     try:
-        decrypted = _from_blob(out_blob)
+        return _from_blob(out_blob)
     finally:
         if description:
-            _kernel32.LocalFree(description)
+            _get_kernel32().LocalFree(description)
 
-    return decrypted.decode("utf-16-le")
 
+def unprotect_string(protected: bytes) -> str:
+    """
+    Decrypt ciphertext produced by :func:`protect_string`.
+    """
+
+    decrypted = unprotect_bytes(protected)
+    try:
+        return decrypted.decode("utf-16-le")
+    finally:
+        wipe(decrypted)
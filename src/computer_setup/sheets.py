@@ -7,6 +7,9 @@ from pathlib import Path
 from typing import Callable, Tuple
 
 import gspread
+from gspread.utils import absolute_range_name
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 HEADERS = ["Domain", "Sequence", "Hostname", "AssignedUser", "Status", "Timestamp", "Notes"]
 
@@ -16,18 +19,32 @@ class SheetsClient:
         if not credentials_path.exists():
             raise FileNotFoundError(f"Google credentials file not found: {credentials_path}")
         self._client = gspread.service_account(filename=str(credentials_path))
+        # The session already pools keep-alive connections; the adapter only
+        # adds retries for transient failures on idempotent requests.
+        retry = Retry(
+            total=3,
+            backoff_factor=0.2,
+            status_forcelist=(429, 500, 502, 503, 504),
+            raise_on_status=False,
+        )
+        self._client.http_client.session.mount(
+            "https://", HTTPAdapter(pool_connections=4, pool_maxsize=4, max_retries=retry)
+        )
+        self._worksheets: dict[tuple[str, str], gspread.Worksheet] = {}
 
     def _worksheet(self, sheet_id: str, worksheet: str):
-        sh = self._client.open_by_key(sheet_id)
-        ws = sh.worksheet(worksheet)
-        self._ensure_header(ws)
+        key = (sheet_id, worksheet)
+        ws = self._worksheets.get(key)
+        if ws is None:
+            ws = self._client.open_by_key(sheet_id).worksheet(worksheet)
+            self._worksheets[key] = ws
         return ws
 
     @staticmethod
-    def _ensure_header(ws) -> None:
+    def _ensure_header(ws, headers: list[str]) -> None:
+        """Rewrite the header row if *headers* (as already read from row 1) differ."""
         if not ws.row_count:
             ws.resize(rows=1, cols=len(HEADERS))
-        headers = ws.row_values(1)
         if headers != HEADERS:
             ws.update("A1:G1", [HEADERS])
 
@@ -39,15 +56,28 @@ class SheetsClient:
         sheet_id: str,
         worksheet: str,
         hostname_factory: Callable[[int], str],
-    ) -> Tuple[int, str, str]:
-        ws = self._worksheet(sheet_id, worksheet)
-        records = ws.get_all_records()
+    ) -> Tuple[int, str, str, int]:
+        http = self._client.http_client
+        # One values.batchGet for the header row plus the Domain and Sequence
+        # columns, which are all that is needed to find the next number. The
+        # worksheet itself is only opened if the header needs repairing.
+        response = http.values_batch_get(
+            sheet_id,
+            [absolute_range_name(worksheet, "A1:G1"), absolute_range_name(worksheet, "A2:B")],
+        )
+        header_range, data_range = (vr.get("values", []) for vr in response["valueRanges"])
+        headers = header_range[0] if header_range else []
+        if headers != HEADERS:
+            self._ensure_header(self._worksheet(sheet_id, worksheet), headers)
         domain_lower = domain.lower()
         max_seq = 0
-        for row in records:
-            if str(row.get("Domain", "")).strip().lower() == domain_lower:
+        for row in data_range:
+            if len(row) < 2:
+                continue
+            row_domain, row_seq = row[0], row[1]
+            if str(row_domain).strip().lower() == domain_lower:
                 try:
-                    seq = int(row.get("Sequence", 0))
+                    seq = int(row_seq)
                     max_seq = max(max_seq, seq)
                 except ValueError:
                     continue
@@ -55,29 +85,32 @@ class SheetsClient:
         hostname = hostname_factory(next_seq)
         timestamp = datetime.now(tz=timezone.utc).isoformat()
         row = [domain, next_seq, hostname, assigned_user, "Pending", timestamp, ""]
-        result = ws.append_row(row, value_input_option="USER_ENTERED")
+        result = http.values_append(
+            sheet_id,
+            absolute_range_name(worksheet),
+            params={"valueInputOption": "USER_ENTERED"},
+            body={"values": [row]},
+        )
         updated_range = result["updates"]["updatedRange"]
         row_number = int(updated_range.split("!")[1].split(":")[0][1:])
-        return next_seq, hostname, f"{worksheet}!A{row_number}:G{row_number}"
+        return next_seq, hostname, f"{worksheet}!A{row_number}:G{row_number}", row_number
 
     def update_status(
         self,
         *,
         sheet_id: str,
         worksheet: str,
-        row_range: str,
+        row_number: int,
         status: str,
         notes: str = "",
     ) -> None:
-        ws = self._worksheet(sheet_id, worksheet)
-        # Extract row number from range like "Devices!A5:G5"
-        parts = row_range.split("!")
-        range_part = parts[-1]
-        start_cell = range_part.split(":")[0]
-        row_number = int("".join(filter(str.isdigit, start_cell)))
         timestamp = datetime.now(tz=timezone.utc).isoformat()
-        ws.update(
-            f"E{row_number}:G{row_number}",
-            [[status, timestamp, notes]],
+        # The row is already known, so write the cells directly instead of
+        # opening the spreadsheet and re-verifying the header row first.
+        self._client.http_client.values_update(
+            sheet_id,
+            absolute_range_name(worksheet, f"E{row_number}:G{row_number}"),
+            params={"valueInputOption": "RAW"},
+            body={"values": [[status, timestamp, notes]]},
         )
 
@@ -2,23 +2,55 @@
 
 from __future__ import annotations
 
-import json
+import base64
+import os
+import re
 from dataclasses import asdict, dataclass, field
 from pathlib import Path
 from typing import Any
 
 STATE_DIR = Path(r"C:\ProgramData\ComputerSetup")
 STATE_FILE = STATE_DIR / "state.json"
+# Version 1 stored DPAPI ciphertext as Base64; version 2 uses Base85.
+STATE_VERSION = 2
 
 
-@dataclass
+# Matches the start row of a range like "Devices!A5:G5".
+_RANGE_ROW_RE = re.compile(r"(?:.*!)?[A-Z]+(\d+)")
+
+
+def _row_from_range(sheet_range: str) -> int:
+    # State files written before sheet_row was stored only carry the range.
+    match = _RANGE_ROW_RE.match(sheet_range)
+    if match is None:
+        raise ValueError(f"Cannot determine sheet row from range: {sheet_range}")
+    return int(match.group(1))
+
+
+@dataclass(slots=True)
 class Secrets:
-    local_admin_password: str
+    local_admin_password: bytes
     domain_username: str
-    domain_password: str
+    domain_password: bytes
+
+    def to_json(self) -> dict[str, Any]:
+        return {
+            "local_admin_password": base64.b85encode(self.local_admin_password).decode("ascii"),
+            "domain_username": self.domain_username,
+            "domain_password": base64.b85encode(self.domain_password).decode("ascii"),
+        }
 
+    @classmethod
+    def from_json(cls, data: dict[str, Any], version: int = STATE_VERSION) -> "Secrets":
+        decode = base64.b64decode if version < 2 else base64.b85decode
+        return cls(
+            local_admin_password=decode(data["local_admin_password"]),
+            domain_username=data["domain_username"],
+            domain_password=decode(data["domain_password"]),
+        )
 
-@dataclass
+
+@dataclass(slots=True)
 class SetupState:
     version: int
     domain: str
@@ -29,6 +61,7 @@ class SetupState:
     sheet_id: str
     worksheet: str
     sheet_range: str
+    sheet_row: int
     secrets: Secrets = field(repr=False)
 
     @classmethod
@@ -43,10 +76,11 @@ class SetupState:
         sheet_id: str,
         worksheet: str,
         sheet_range: str,
+        sheet_row: int,
         secrets: Secrets,
     ) -> "SetupState":
         return cls(
-            version=1,
+            version=STATE_VERSION,
             domain=domain,
             assigned_user=assigned_user,
             computer_name=computer_name,
@@ -55,18 +89,20 @@ class SetupState:
             sheet_id=sheet_id,
             worksheet=worksheet,
             sheet_range=sheet_range,
+            sheet_row=sheet_row,
             secrets=secrets,
         )
 
     def to_json(self) -> dict[str, Any]:
         result = asdict(self)
+        result["secrets"] = self.secrets.to_json()
         return result
 
     @classmethod
     def from_json(cls, data: dict[str, Any]) -> "SetupState":
-        secrets = data.get("secrets") or {}
+        version = data.get("version", 1)
         return cls(
-            version=data.get("version", 1),
+            version=version,
             domain=data["domain"],
             assigned_user=data["assigned_user"],
             computer_name=data["computer_name"],
@@ -75,25 +111,36 @@ class SetupState:
             sheet_id=data["sheet_id"],
             worksheet=data["worksheet"],
             sheet_range=data["sheet_range"],
-            secrets=Secrets(
-                local_admin_password=secrets["local_admin_password"],
-                domain_username=secrets["domain_username"],
-                domain_password=secrets["domain_password"],
-            ),
+            sheet_row=data.get("sheet_row") or _row_from_range(data["sheet_range"]),
+            secrets=Secrets.from_json(data.get("secrets") or {}, version),
         )
 
 
 def save_state(state: SetupState, path: Path = STATE_FILE) -> Path:
+    import orjson
+
     STATE_DIR.mkdir(parents=True, exist_ok=True)
-    payload = state.to_json()
-    with path.open("w", encoding="utf-8") as fp:
-        json.dump(payload, fp, indent=2)
+    payload = orjson.dumps(state.to_json(), option=orjson.OPT_INDENT_2)
+    # Write to a sibling file and swap it in so a power loss mid-provisioning
+    # never leaves a truncated state file behind.
+    tmp_path = path.with_name(path.name + ".tmp")
+    try:
+        with tmp_path.open("wb") as fp:
+            fp.write(payload)
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        # The temp file holds the encrypted secrets; don't leave it behind.
+        tmp_path.unlink(missing_ok=True)
+        raise
     return path
 
 
 def load_state(path: Path = STATE_FILE) -> SetupState:
-    with path.open("r", encoding="utf-8") as fp:
-        data = json.load(fp)
+    import orjson
+
+    data = orjson.loads(path.read_bytes())
     return SetupState.from_json(data)
 
 
@@ -2,12 +2,18 @@
 
 from __future__ import annotations
 
+import base64
 import ctypes
+import functools
+import locale
 import subprocess
 import os
+import sys
+from ctypes import wintypes
 from pathlib import Path
-from typing import Sequence
-from winreg import HKEY_LOCAL_MACHINE, KEY_SET_VALUE, KEY_WRITE, OpenKey, SetValueEx, DeleteValue, REG_SZ
+from typing import Optional, Union
+
+from .security import wipe
 
 
 class CommandError(RuntimeError):
@@ -30,8 +36,14 @@ def _escape_single_quotes(value: str) -> str:
     return value.replace("'", "''")
 
 
-def _run_powershell(lines: Sequence[str]) -> subprocess.CompletedProcess[str]:
-    script = "; ".join(lines)
+def _run_powershell(script: str, stdin: bytes | bytearray | None = None) -> subprocess.CompletedProcess[bytes]:
+    """
+    Run *script* in PowerShell. *stdin* is passed through unchanged as binary
+    input, which keeps secrets out of the script source and command line.
+    """
+    # -EncodedCommand takes the script as Base64 UTF-16-LE, so it survives
+    # command-line quoting unchanged and can span multiple lines.
+    encoded = base64.b64encode(script.encode("utf-16-le")).decode("ascii")
     result = subprocess.run(
         [
             "powershell.exe",
@@ -39,111 +51,385 @@ def _run_powershell(lines: Sequence[str]) -> subprocess.CompletedProcess[str]:
             "-NonInteractive",
             "-ExecutionPolicy",
             "Bypass",
-            "-Command",
-            script,
+            "-OutputFormat",
+            "Text",
+            "-EncodedCommand",
+            encoded,
         ],
+        input=stdin,
         capture_output=True,
-        text=True,
     )
     if result.returncode != 0:
-        raise CommandError(result.stderr.strip() or result.stdout.strip())
+        encoding = locale.getpreferredencoding(False)
+        stderr = result.stderr.decode(encoding, errors="replace").strip()
+        stdout = result.stdout.decode(encoding, errors="replace").strip()
+        raise CommandError(stderr or stdout)
     return result
 
 
-def rename_computer(new_name: str) -> None:
-    _run_powershell(
-        [
-            f"Rename-Computer -NewName '{_escape_single_quotes(new_name)}' -Force -ErrorAction Stop",
-        ]
-    )
+# The password arrives on stdin as UTF-16-LE, read without relying on the
+# console input code page.
+_LOCAL_ADMIN_TEMPLATE = """\
+$stdin = New-Object System.IO.StreamReader([Console]::OpenStandardInput(), [System.Text.Encoding]::Unicode)
+$SecurePassword = $stdin.ReadToEnd() | ConvertTo-SecureString -AsPlainText -Force
+$existing = Get-LocalUser -Name '{user}' -ErrorAction SilentlyContinue
+if ($existing) {{
+  Set-LocalUser -Name $existing.Name -Password $SecurePassword -PasswordNeverExpires $true -ErrorAction Stop
+}} else {{
+  New-LocalUser -Name '{user}' -Password $SecurePassword -AccountNeverExpires -PasswordNeverExpires $true -ErrorAction Stop
+}}
+Add-LocalGroupMember -Group 'Administrators' -Member '{user}' -ErrorAction Stop"""
+
+_REMOVE_USER_TEMPLATE = """\
+$existing = Get-LocalUser -Name '{user}' -ErrorAction SilentlyContinue
+if ($existing) {{
+  try {{
+    Remove-LocalUser -Name $existing.Name -ErrorAction Stop
+  }} catch {{
+    throw "Unable to remove local user $($existing.Name): $($_.Exception.Message)"
+  }}
+}}"""
+
+
+_COMPUTER_NAME_PHYSICAL_DNS_HOSTNAME = 5
+
+NETSETUP_JOIN_DOMAIN = 0x00000001
+NETSETUP_ACCT_CREATE = 0x00000002
+NETSETUP_JOIN_WITH_NEW_NAME = 0x00000400
+
+
+@functools.lru_cache(maxsize=None)
+def _get_kernel32() -> ctypes.WinDLL:
+    kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+    kernel32.SetComputerNameExW.argtypes = [ctypes.c_int, wintypes.LPCWSTR]
+    kernel32.SetComputerNameExW.restype = wintypes.BOOL
+    kernel32.CloseHandle.argtypes = [wintypes.HANDLE]
+    kernel32.CloseHandle.restype = wintypes.BOOL
+    kernel32.GetStdHandle.argtypes = [wintypes.DWORD]
+    kernel32.GetStdHandle.restype = wintypes.HANDLE
+    kernel32.GetConsoleMode.argtypes = [wintypes.HANDLE, ctypes.POINTER(wintypes.DWORD)]
+    kernel32.GetConsoleMode.restype = wintypes.BOOL
+    kernel32.SetConsoleMode.argtypes = [wintypes.HANDLE, wintypes.DWORD]
+    kernel32.SetConsoleMode.restype = wintypes.BOOL
+    kernel32.ReadConsoleW.argtypes = [
+        wintypes.HANDLE,
+        ctypes.c_void_p,
+        wintypes.DWORD,
+        ctypes.POINTER(wintypes.DWORD),
+        ctypes.c_void_p,
+    ]
+    kernel32.ReadConsoleW.restype = wintypes.BOOL
+    return kernel32
+
+
+@functools.lru_cache(maxsize=None)
+def _get_netapi32() -> ctypes.WinDLL:
+    netapi32 = ctypes.WinDLL("netapi32")
+    netapi32.NetJoinDomain.argtypes = [
+        wintypes.LPCWSTR,
+        wintypes.LPCWSTR,
+        wintypes.LPCWSTR,
+        wintypes.LPCWSTR,
+        wintypes.LPCWSTR,
+        wintypes.DWORD,
+    ]
+    netapi32.NetJoinDomain.restype = wintypes.DWORD
+    return netapi32
 
 
-def create_or_update_local_admin(username: str, password: str) -> None:
-    escaped_user = _escape_single_quotes(username)
-    escaped_pass = _escape_single_quotes(password)
-    commands = [
-        f"$SecurePassword = ConvertTo-SecureString '{escaped_pass}' -AsPlainText -Force",
-        f"$existing = Get-LocalUser -Name '{escaped_user}' -ErrorAction SilentlyContinue",
-        "if ($existing) {",
-        "  Set-LocalUser -Name $existing.Name -Password $SecurePassword -PasswordNeverExpires $true -ErrorAction Stop",
-        "} else {",
-        f"  New-LocalUser -Name '{escaped_user}' -Password $SecurePassword -AccountNeverExpires -PasswordNeverExpires $true -ErrorAction Stop",
-        "}",
-        f"Add-LocalGroupMember -Group 'Administrators' -Member '{escaped_user}' -ErrorAction Stop",
-    ]
-    _run_powershell(commands)
+def rename_computer(new_name: str) -> None:
+    """Set the computer's DNS host name (and NetBIOS name); applies after restart."""
+    if not _get_kernel32().SetComputerNameExW(_COMPUTER_NAME_PHYSICAL_DNS_HOSTNAME, new_name):
+        code = ctypes.get_last_error()
+        raise CommandError(f"Unable to rename computer to {new_name}: {ctypes.FormatError(code)}")
+
+
+_STD_INPUT_HANDLE = wintypes.DWORD(-10 & 0xFFFFFFFF).value
+_ENABLE_ECHO_INPUT = 0x0004
+_READ_CHUNK_CHARS = 256
+
+
+def read_console_password(prompt: str) -> bytearray:
+    """
+    Read one line from the console with echo disabled into a UTF-16-LE
+    ``bytearray``, so the secret is never held in an immutable ``str``.
+    The console performs its own line editing, so backspace, dead keys and
+    characters such as ``à`` behave as at any other prompt.
+    """
+
+    kernel32 = _get_kernel32()
+    handle = kernel32.GetStdHandle(_STD_INPUT_HANDLE)
+    mode = wintypes.DWORD()
+    if not kernel32.GetConsoleMode(handle, ctypes.byref(mode)):
+        raise CommandError("Password entry requires an interactive console")
+
+    sys.stdout.write(prompt)
+    sys.stdout.flush()
+    chunk = (ctypes.c_wchar * _READ_CHUNK_CHARS)()
+    read = wintypes.DWORD()
+    buf = bytearray()
+    kernel32.SetConsoleMode(handle, mode.value & ~_ENABLE_ECHO_INPUT)
+    try:
+        while True:
+            if not kernel32.ReadConsoleW(handle, chunk, _READ_CHUNK_CHARS, ctypes.byref(read), None):
+                raise ctypes.WinError(ctypes.get_last_error())
+            count = read.value
+            if count == 0:
+                # Ctrl+C/Ctrl+Break aborts the read without returning any input.
+                raise KeyboardInterrupt
+            end = next((i for i in range(count) if chunk[i] in "\r\n"), None)
+            used = count if end is None else end
+            buf += (ctypes.c_char * (used * ctypes.sizeof(ctypes.c_wchar))).from_buffer(chunk)
+            if end is not None:
+                if chunk[end] == "\r" and end == count - 1:
+                    # The line feed did not fit in this chunk; consume it.
+                    kernel32.ReadConsoleW(handle, chunk, 1, ctypes.byref(read), None)
+                return buf
+    except BaseException:
+        wipe(buf)
+        raise
+    finally:
+        ctypes.memset(chunk, 0, ctypes.sizeof(chunk))
+        kernel32.SetConsoleMode(handle, mode.value)
+        sys.stdout.write("\n")
+
+
+def create_or_update_local_admin(username: str, password: str | bytearray) -> None:
+    """
+    Create or update *username* as a local administrator. *password* may be a
+    UTF-16-LE ``bytearray``; it is written to PowerShell's stdin and never
+    appears in the script or on the command line.
+    """
+    data = password if isinstance(password, bytearray) else bytearray(password.encode("utf-16-le"))
+    try:
+        # The user name is interpolated into PowerShell source, so it keeps
+        # its single-quote escaping even though -EncodedCommand needs none.
+        _run_powershell(_LOCAL_ADMIN_TEMPLATE.format(user=_escape_single_quotes(username)), stdin=data)
+    finally:
+        if data is not password:
+            wipe(data)
 
 
 def remove_local_user(username: str) -> None:
-    escaped_user = _escape_single_quotes(username)
-    commands = [
-        f"$existing = Get-LocalUser -Name '{escaped_user}' -ErrorAction SilentlyContinue",
-        "if ($existing) {",
-        "  try {",
-        "    Remove-LocalUser -Name $existing.Name -ErrorAction Stop",
-        "  } catch {",
-        "    throw \"Unable to remove local user $($existing.Name): $($_.Exception.Message)\"",
-        "  }",
-        "}",
+    _run_powershell(_REMOVE_USER_TEMPLATE.format(user=_escape_single_quotes(username)))
+
+
+def _wide_buffer(data: bytearray) -> ctypes.Array:
+    """Copy UTF-16-LE *data* into a NUL-terminated wide-character buffer."""
+    buf = (ctypes.c_wchar * (len(data) // 2 + 1))()
+    ctypes.memmove(buf, (ctypes.c_char * len(data)).from_buffer(data), len(data))
+    return buf
+
+
+def join_domain(
+    domain: str,
+    username: str,
+    password: str | bytearray,
+    *,
+    ou_path: str | None = None,
+    restart: bool = False,
+) -> None:
+    """
+    Join *domain*. *password* may be a UTF-16-LE ``bytearray`` so it never has
+    to exist as an immutable ``str``; the temporary wide buffer is zeroed
+    after the call.
+    """
+    # Join under the pending name when initial-run renamed the machine without a restart.
+    options = NETSETUP_JOIN_DOMAIN | NETSETUP_ACCT_CREATE | NETSETUP_JOIN_WITH_NEW_NAME
+    password_arg = _wide_buffer(password) if isinstance(password, bytearray) else password
+    try:
+        status = _get_netapi32().NetJoinDomain(None, domain, ou_path, username, password_arg, options)
+    finally:
+        if isinstance(password_arg, ctypes.Array):
+            ctypes.memset(password_arg, 0, ctypes.sizeof(password_arg))
+    if status != 0:
+        raise CommandError(f"Unable to join domain {domain}: {ctypes.FormatError(status)} ({status})")
+    if restart:
+        restart_computer(delay_seconds=0)
+
+
+_WINLOGON_KEY = r"SOFTWARE\Microsoft\Windows NT\CurrentVersion\Winlogon"
+_RUN_ONCE_KEY = r"SOFTWARE\Microsoft\Windows\CurrentVersion\RunOnce"
+
+# Maps an HKLM key path to the values to write under it; ``None`` deletes the
+# value and a ``bytearray`` holds UTF-16-LE text (used for passwords).
+RegistryPlan = dict[str, dict[str, Optional[Union[str, bytearray]]]]
+
+
+# Sign-extended on 64-bit, as the SDK's (HKEY)(ULONG_PTR)(LONG)0x80000002 is.
+_HKEY_LOCAL_MACHINE = wintypes.HKEY(-0x7FFFFFFE)
+_KEY_WRITE = 0x20006
+_REG_SZ = 1
+_REG_OPTION_NON_VOLATILE = 0
+_ERROR_SUCCESS = 0
+_ERROR_FILE_NOT_FOUND = 2
+_INVALID_HANDLE_VALUE = wintypes.HANDLE(-1).value
+
+
+@functools.lru_cache(maxsize=None)
+def _get_ktmw32() -> ctypes.WinDLL:
+    ktmw32 = ctypes.WinDLL("ktmw32", use_last_error=True)
+    ktmw32.CreateTransaction.argtypes = [
+        ctypes.c_void_p,
+        ctypes.c_void_p,
+        wintypes.DWORD,
+        wintypes.DWORD,
+        wintypes.DWORD,
+        wintypes.DWORD,
+        wintypes.LPWSTR,
     ]
-    _run_powershell(commands)
-
-
-def join_domain(domain: str, username: str, password: str, *, ou_path: str | None = None, restart: bool = False) -> None:
-    escaped_user = _escape_single_quotes(username)
-    escaped_pass = _escape_single_quotes(password)
-    cmd = [
-        f"$SecurePassword = ConvertTo-SecureString '{escaped_pass}' -AsPlainText -Force",
-        f"$Credential = New-Object System.Management.Automation.PSCredential('{escaped_user}', $SecurePassword)",
-        f"Add-Computer -DomainName '{_escape_single_quotes(domain)}' -Credential $Credential"
+    ktmw32.CreateTransaction.restype = wintypes.HANDLE
+    ktmw32.CommitTransaction.argtypes = [wintypes.HANDLE]
+    ktmw32.CommitTransaction.restype = wintypes.BOOL
+    ktmw32.RollbackTransaction.argtypes = [wintypes.HANDLE]
+    ktmw32.RollbackTransaction.restype = wintypes.BOOL
+    return ktmw32
+
+
+@functools.lru_cache(maxsize=None)
+def _get_advapi32() -> ctypes.WinDLL:
+    advapi32 = ctypes.WinDLL("advapi32")
+    advapi32.RegCreateKeyTransactedW.argtypes = [
+        wintypes.HKEY,
+        wintypes.LPCWSTR,
+        wintypes.DWORD,
+        wintypes.LPWSTR,
+        wintypes.DWORD,
+        wintypes.DWORD,
+        ctypes.c_void_p,
+        ctypes.POINTER(wintypes.HKEY),
+        ctypes.POINTER(wintypes.DWORD),
+        wintypes.HANDLE,
+        ctypes.c_void_p,
     ]
-    if ou_path:
-        cmd[-1] += f" -OUPath '{_escape_single_quotes(ou_path)}'"
-    if restart:
-        cmd[-1] += " -Restart"
-    cmd[-1] += " -ErrorAction Stop"
-    _run_powershell(cmd)
-
-
-def _set_reg_values(key_path: str, values: dict[str, str]) -> None:
-    with OpenKey(HKEY_LOCAL_MACHINE, key_path, 0, KEY_WRITE) as key:
-        for name, data in values.items():
-            SetValueEx(key, name, 0, REG_SZ, data)
+    advapi32.RegCreateKeyTransactedW.restype = wintypes.LONG
+    advapi32.RegSetValueExW.argtypes = [
+        wintypes.HKEY,
+        wintypes.LPCWSTR,
+        wintypes.DWORD,
+        wintypes.DWORD,
+        ctypes.c_void_p,
+        wintypes.DWORD,
+    ]
+    advapi32.RegSetValueExW.restype = wintypes.LONG
+    advapi32.RegDeleteValueW.argtypes = [wintypes.HKEY, wintypes.LPCWSTR]
+    advapi32.RegDeleteValueW.restype = wintypes.LONG
+    advapi32.RegCloseKey.argtypes = [wintypes.HKEY]
+    advapi32.RegCloseKey.restype = wintypes.LONG
+    return advapi32
 
 
-def _delete_reg_values(key_path: str, names: Sequence[str]) -> None:
-    with OpenKey(HKEY_LOCAL_MACHINE, key_path, 0, KEY_SET_VALUE) as key:
-        for name in names:
-            try:
-                DeleteValue(key, name)
-            except FileNotFoundError:
-                continue
+def _check_status(status: int) -> None:
+    if status != _ERROR_SUCCESS:
+        raise ctypes.WinError(status)
 
 
-def configure_autologon(username: str, password: str) -> None:
+def _set_string_value(key: wintypes.HKEY, name: str, data: str | bytearray) -> None:
+    buf = _wide_buffer(data) if isinstance(data, bytearray) else ctypes.create_unicode_buffer(data)
+    try:
+        _check_status(_get_advapi32().RegSetValueExW(key, name, 0, _REG_SZ, buf, ctypes.sizeof(buf)))
+    finally:
+        # Values include DefaultPassword; don't leave a copy in the buffer.
+        ctypes.memset(buf, 0, ctypes.sizeof(buf))
+
+
+def _apply_registry_plan(plan: RegistryPlan) -> None:
+    """
+    Apply *plan* inside a single KTM transaction so either every value is
+    written or none are (e.g. never AutoAdminLogon=1 without its password).
+    """
+
+    advapi32 = _get_advapi32()
+    ktmw32 = _get_ktmw32()
+    transaction = ktmw32.CreateTransaction(None, None, 0, 0, 0, 0, "computer-setup registry plan")
+    if transaction == _INVALID_HANDLE_VALUE:
+        raise ctypes.WinError(ctypes.get_last_error())
+    try:
+        try:
+            for key_path, values in plan.items():
+                key = wintypes.HKEY()
+                _check_status(
+                    advapi32.RegCreateKeyTransactedW(
+                        _HKEY_LOCAL_MACHINE,
+                        key_path,
+                        0,
+                        None,
+                        _REG_OPTION_NON_VOLATILE,
+                        _KEY_WRITE,
+                        None,
+                        ctypes.byref(key),
+                        None,
+                        transaction,
+                        None,
+                    )
+                )
+                try:
+                    for name, data in values.items():
+                        if data is None:
+                            status = advapi32.RegDeleteValueW(key, name)
+                            if status != _ERROR_FILE_NOT_FOUND:
+                                _check_status(status)
+                        else:
+                            _set_string_value(key, name, data)
+                finally:
+                    advapi32.RegCloseKey(key)
+            if not ktmw32.CommitTransaction(transaction):
+                raise ctypes.WinError(ctypes.get_last_error())
+        except BaseException:
+            ktmw32.RollbackTransaction(transaction)
+            raise
+    finally:
+        _get_kernel32().CloseHandle(transaction)
+
+
+def apply_registry_plans(*plans: RegistryPlan) -> None:
+    """Merge *plans* and apply them in one transaction, opening each key once."""
+
+    merged: RegistryPlan = {}
+    for plan in plans:
+        for key_path, values in plan.items():
+            merged.setdefault(key_path, {}).update(values)
+    _apply_registry_plan(merged)
+
+
+def autologon_plan(username: str, password: str | bytearray) -> RegistryPlan:
     machine_name = os.environ.get("COMPUTERNAME", "localhost")
-    key_path = r"SOFTWARE\Microsoft\Windows NT\CurrentVersion\Winlogon"
-    _set_reg_values(
-        key_path,
-        {
+    return {
+        _WINLOGON_KEY: {
             "AutoAdminLogon": "1",
             "ForceAutoLogon": "1",
             "DefaultUserName": username,
             "DefaultPassword": password,
             "DefaultDomainName": machine_name,
-        },
-    )
+        }
+    }
+
+
+def clear_autologon_plan() -> RegistryPlan:
+    return {
+        _WINLOGON_KEY: {
+            "AutoAdminLogon": "0",
+            "ForceAutoLogon": "0",
+            "DefaultPassword": None,
+            "DefaultDomainName": None,
+        }
+    }
+
+
+def run_once_plan(name: str, command: str) -> RegistryPlan:
+    return {_RUN_ONCE_KEY: {name: command}}
+
+
+def configure_autologon(username: str, password: str | bytearray) -> None:
+    _apply_registry_plan(autologon_plan(username, password))
 
 
 def clear_autologon() -> None:
-    key_path = r"SOFTWARE\Microsoft\Windows NT\CurrentVersion\Winlogon"
-    _set_reg_values(key_path, {"AutoAdminLogon": "0", "ForceAutoLogon": "0"})
-    _delete_reg_values(key_path, ["DefaultPassword", "DefaultDomainName"])
+    _apply_registry_plan(clear_autologon_plan())
 
 
 def register_run_once(name: str, command: str) -> None:
-    key_path = r"SOFTWARE\Microsoft\Windows\CurrentVersion\RunOnce"
-    _set_reg_values(key_path, {name: command})
+    _apply_registry_plan(run_once_plan(name, command))
 
 
 def logoff_current_user() -> None: